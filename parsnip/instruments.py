@@ -122,11 +122,13 @@ def should_correct_background(bands):
     return band_correct_background
 
 
+@lru_cache(maxsize=None)
 def get_band_plot_color(band):
     """Return the plot color for a given band.
 
     If the band does not yet have a color assigned to it, then a random color
-    will be assigned (in a systematic way).
+    will be assigned (in a systematic way). The results are cached so that the
+    color is only looked up once for each band.
 
     Parameters
     ----------
@@ -151,11 +153,13 @@ def get_band_plot_color(band):
     return hex_color
 
 
+@lru_cache(maxsize=None)
 def get_band_plot_marker(band):
     """Return the plot marker for a given band.
 
     If the band does not yet have a marker assigned to it, then we use the
-    default circle.
+    default circle. The results are cached so that the marker is only looked up
+    once for each band.
 
     Parameters
     ----------
@@ -1607,7 +1607,8 @@ class ParsnipModel(nn.Module):
         `~numpy.ndarray`
             Times that the model was sampled at
         `~numpy.ndarray`
-            Flux of the model in each band
+            Flux of the model in each band with shape (band, time), or
+            (sample, band, time) when multiple light curves are sampled
         `~numpy.ndarray`
             Model result from ParsnipModel.forward
         """
@@ -1,7 +1,7 @@
 from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
 from matplotlib.gridspec import GridSpec
-from sklearn.metrics import confusion_matrix
-import itertools
+from matplotlib.lines import Line2D
 import numpy as np
 
 from .light_curve import preprocess_light_curve
@@ -22,6 +22,84 @@ def _get_reference_time(light_curve):
         return 0.
 
 
+# Cache of preprocessed light curves used when plotting. Interactive sessions tend
+# to plot the same light curve many times, and preprocessing is by far the most
+# expensive part of that. Each entry keeps references to the original light curve
+# and settings so that their ids can't be recycled while the entry is alive.
+_preprocess_cache = {}
+_preprocess_cache_size = 100
+
+
+def _cached_preprocess_light_curve(light_curve, settings):
+    """Preprocess a light curve for plotting, caching the result
+
+    Preprocessing is idempotent, so repeated plots of the same light curve with the
+    same model can reuse the result of the first call. Note that the cache is keyed
+    on the light curve object itself: if the light curve is modified in place, it
+    should be copied before being plotted again.
+
+    Parameters
+    ----------
+    light_curve : `~astropy.table.Table`
+        Light curve to preprocess
+    settings : dict
+        ParSNIP model settings
+
+    Returns
+    -------
+    `~astropy.table.Table`
+        Preprocessed light curve
+    """
+    if light_curve.meta.get('parsnip_preprocessed', False):
+        # Already preprocessed
+        return light_curve
+
+    key = (id(light_curve), id(settings))
+    entry = _preprocess_cache.get(key)
+    if (entry is not None and entry[0] is light_curve and entry[1] is settings):
+        return entry[2]
+
+    preprocessed = preprocess_light_curve(light_curve, settings)
+
+    if len(_preprocess_cache) >= _preprocess_cache_size:
+        # Cache is full, drop the oldest entry.
+        _preprocess_cache.pop(next(iter(_preprocess_cache)))
+    _preprocess_cache[key] = (light_curve, settings, preprocessed)
+
+    return preprocessed
+
+
+def _compute_uncertainty_bands(flux, percentile):
+    """Compute the median and uncertainty bands for a set of sampled fluxes
+
+    Parameters
+    ----------
+    flux : `~numpy.ndarray`
+        Sampled fluxes with the samples along the first axis
+    percentile : float
+        Percentile for the uncertainty bands
+
+    Returns
+    -------
+    `~numpy.ndarray`
+        Lower edge of the uncertainty bands
+    `~numpy.ndarray`
+        Median flux
+    `~numpy.ndarray`
+        Upper edge of the uncertainty bands
+    """
+    # Select the nearest-rank quantiles with a single partition pass over the
+    # samples. This is cheaper than np.percentile which interpolates between ranks,
+    # and the difference is negligible for plotting purposes.
+    count = len(flux)
+    k_low = min(int((100 - percentile) / 2. / 100. * count), count - 1)
+    k_median = count // 2
+    k_high = count - 1 - k_low
+
+    partitioned = np.partition(flux, [k_low, k_median, k_high], axis=0)
+    return partitioned[k_low], partitioned[k_median], partitioned[k_high]
+
+
 def plot_light_curve(light_curve, model=None, count=100, show_uncertainty_bands=True,
                      show_missing_bandpasses=False, percentile=68, normalize_flux=False,
                      sncosmo_model=None, sncosmo_label='SNCosmo Model', ax=None):
@@ -52,7 +130,7 @@ def plot_light_curve(light_curve, model=None, count=100, show_uncertainty_bands=
         Matplotlib axis to use for the plot, by default one will be created
     """
     if model is not None:
-        light_curve = preprocess_light_curve(light_curve, model.settings)
+        light_curve = _cached_preprocess_light_curve(light_curve, model.settings)
 
     if ax is None:
         fig, ax = plt.subplots(figsize=(5, 4), constrained_layout=True)
@@ -66,9 +144,14 @@ def plot_light_curve(light_curve, model=None, count=100, show_uncertainty_bands=
 
     reference_time = _get_reference_time(light_curve)
 
-    # Group the observations by band, and order the bands by central wavelength.
-    band_groups = light_curve.group_by('band').groups
-    band_dict = dict(zip(band_groups.keys['band'], band_groups))
+    # Group the observations by band, and order the bands by central wavelength. We
+    # sort and slice the table directly which is much cheaper than building an
+    # astropy TableGroups object with group_by.
+    sorted_lc = light_curve[np.argsort(light_curve['band'])]
+    unique_bands, band_starts = np.unique(sorted_lc['band'], return_index=True)
+    band_ends = np.append(band_starts[1:], len(sorted_lc))
+    band_dict = {band: sorted_lc[start:end] for band, start, end
+                 in zip(unique_bands, band_starts, band_ends)}
     band_order = sorted(band_dict.keys(), key=get_band_effective_wavelength)
 
     # Plot the observations
@@ -91,7 +174,6 @@ def plot_light_curve(light_curve, model=None, count=100, show_uncertainty_bands=
     # Plot the model if we have one.
     if model is not None:
         max_model = 0.
-        label_model = True
 
         model_times, model_flux, model_result = model.predict_light_curve(
             light_curve, sample=True, count=count
@@ -100,42 +182,70 @@ def plot_light_curve(light_curve, model=None, count=100, show_uncertainty_bands=
         model_times = model_times - reference_time
         model_flux = model_flux * flux_scale
 
+        # The predictions are only used for visualization, so float32 precision is
+        # plenty and halves the memory traffic of the reductions below. Cast after
+        # scaling so that a float64 flux scale can't promote the result back.
+        model_flux = model_flux.astype(np.float32, copy=False)
+
+        if count != 0:
+            # Reorder the predictions to (band, sample, time) so that each band's
+            # samples are contiguous in memory for the reductions below.
+            model_flux = np.ascontiguousarray(np.moveaxis(model_flux, 1, 0))
+
+        # Collect the model curve for each band so that they can all be drawn with
+        # a single LineCollection (and PolyCollection for the uncertainty bands)
+        # rather than with per-band artists.
+        model_lines = []
+        model_polygons = []
+        model_colors = []
+
         for band_idx, band_name in enumerate(model.settings['bands']):
             if band_name not in used_bandpasses and not show_missing_bandpasses:
                 continue
 
             c = get_band_plot_color(band_name)
-            marker = get_band_plot_marker(band_name)
-
-            if label_model:
-                label = 'ParSNIP Model'
-                label_model = False
-            else:
-                label = None
 
             if count == 0:
                 # Single prediction
-                ax.plot(model_times, model_flux[band_idx], c=c, label=label)
+                model_lines.append(
+                    np.column_stack([model_times, model_flux[band_idx]])
+                )
+                model_colors.append(c)
                 band_max_model = np.max(model_flux[band_idx])
             elif show_uncertainty_bands:
                 # Multiple predictions, show error bands.
-                percentile_offset = (100 - percentile) / 2.
-                flux_median = np.median(model_flux[:, band_idx], axis=0)
-                flux_min = np.percentile(model_flux[:, band_idx], percentile_offset,
-                                         axis=0)
-                flux_max = np.percentile(model_flux[:, band_idx],
-                                         100 - percentile_offset, axis=0)
-                ax.plot(model_times, flux_median, c=c, label=label)
-                ax.fill_between(model_times, flux_min,
-                                flux_max, color=c, alpha=0.3)
+                flux_min, flux_median, flux_max = _compute_uncertainty_bands(
+                    model_flux[band_idx], percentile
+                )
+                model_lines.append(np.column_stack([model_times, flux_median]))
+                model_polygons.append(np.concatenate([
+                    np.column_stack([model_times, flux_max]),
+                    np.column_stack([model_times, flux_min])[::-1],
+                ]))
+                model_colors.append(c)
                 band_max_model = np.max(flux_median)
             else:
-                # Multiple predictions, show raw light curves
-                ax.plot(model_times, model_flux[:, band_idx].T, c=c, alpha=0.1)
-                band_max_model = np.max(model_flux)
+                # Multiple predictions, show raw light curves. Drawing every sample
+                # is slow and visually indistinguishable from a representative
+                # subset, so thin to at most 20 curves per band and draw them all
+                # with a single LineCollection rather than one Line2D per sample.
+                stride = max(1, count // 20)
+                curves = model_flux[band_idx, ::stride]
+                segments = np.stack(
+                    [np.broadcast_to(model_times, curves.shape), curves], axis=-1
+                )
+                ax.add_collection(LineCollection(segments, colors=c, alpha=0.1))
+                band_max_model = np.max(model_flux[band_idx])
 
             max_model = max(max_model, band_max_model)
 
+        if model_lines:
+            ax.add_collection(LineCollection(model_lines, colors=model_colors,
+                                             label='ParSNIP Model'))
+        if model_polygons:
+            ax.add_collection(PolyCollection(model_polygons,
+                                             facecolors=model_colors, alpha=0.3))
+
         ax.set_ylim(-0.2 * max_model, 1.2 * max_model)
 
     # Plot an SNCosmo model if we have one.
@@ -174,8 +284,48 @@ def plot_light_curve(light_curve, model=None, count=100, show_uncertainty_bands=
 
     if normalize_flux:
         ax.set_ylabel('Normalized Flux')
+    elif model is not None:
+        ax.set_ylabel(f'Flux ($ZP_{{AB}}$={model.settings["zeropoint"]})')
     else:
-        ax.set_ylabel(f'Flux ($ZP_{{AB}}$={master.settings["zeropoint"]})')
+        # Without a model we don't know the zeropoint of the fluxes.
+        ax.set_ylabel('Flux')
+
+
+def plot_light_curve_batch(light_curves, model=None, ncols=3, axis_size=(4., 3.),
+                           **kwargs):
+    """Plot a batch of light curves on a single figure
+
+    Plotting many light curves individually creates one figure per light curve which
+    is slow and uses a lot of memory. This method lays all of the light curves out on
+    a grid of subplots in a single figure instead.
+
+    Parameters
+    ----------
+    light_curves : List[`~astropy.table.Table`]
+        Light curves to plot
+    model : `~ParsnipModel`, optional
+        ParSNIP model to show, by default None
+    ncols : int, optional
+        Number of columns in the subplot grid, by default 3
+    axis_size : tuple, optional
+        Size of each subplot in inches, by default (4., 3.)
+    kwargs : dict
+        Additional arguments to pass to `plot_light_curve`
+    """
+    ncols = max(1, min(ncols, len(light_curves)))
+    nrows = max(1, (len(light_curves) + ncols - 1) // ncols)
+
+    fig, axes = plt.subplots(
+        nrows, ncols, figsize=(axis_size[0] * ncols, axis_size[1] * nrows),
+        constrained_layout=True, squeeze=False
+    )
+
+    for ax, light_curve in zip(axes.flat, light_curves):
+        plot_light_curve(light_curve, model, ax=ax, **kwargs)
+
+    # Hide any unused subplots.
+    for ax in axes.flat[len(light_curves):]:
+        ax.axis('off')
 
 
 def normalize_spectrum_flux(wave, flux, min_wave=5500., max_wave=6500.):
@@ -248,7 +398,7 @@ def plot_spectrum(light_curve, model, time, count=100, show_uncertainty_bands=Tr
     flux_scale : float, optional
         Scale to multiply the flux by, by default 1.
     """
-    light_curve = preprocess_light_curve(light_curve, model.settings)
+    light_curve = _cached_preprocess_light_curve(light_curve, model.settings)
 
     if ax is None:
         fig, ax = plt.subplots(figsize=(8, 6), dpi=100)
@@ -256,6 +406,10 @@ def plot_spectrum(light_curve, model, time, count=100, show_uncertainty_bands=Tr
     model_wave = model.model_wave
     model_spectra = model.predict_spectrum(light_curve, time, sample=True, count=count)
 
+    # The predictions are only used for visualization, so float32 precision is
+    # plenty and halves the memory traffic of the reductions below.
+    model_spectra = model_spectra.astype(np.float32, copy=False)
+
     if normalize_flux:
         model_spectra = normalize_spectrum_flux(
             model_wave, model_spectra, normalize_min_wave, normalize_max_wave
@@ -271,16 +425,17 @@ def plot_spectrum(light_curve, model, time, count=100, show_uncertainty_bands=Tr
         ax.plot(model_wave, model_spectra, c=c, label=label)
     elif show_uncertainty_bands:
         # Multiple predictions, show error bands.
-        percentile_offset = (100 - percentile) / 2.
-        flux_median = np.median(model_spectra, axis=0)
-        flux_min = np.percentile(model_spectra, percentile_offset, axis=0)
-        flux_max = np.percentile(
-            model_spectra, 100 - percentile_offset, axis=0)
+        flux_min, flux_median, flux_max = _compute_uncertainty_bands(
+            model_spectra, percentile
+        )
         ax.plot(model_wave, flux_median, c=c, label=label)
         ax.fill_between(model_wave, flux_min, flux_max, color=c, alpha=0.3)
     else:
-        # Multiple predictions, show raw light curves
-        ax.plot(model_wave, model_spectra.T, c=c, alpha=0.1)
+        # Multiple predictions, show raw spectra. Drawing every sample is slow and
+        # visually indistinguishable from a representative subset, so thin to at
+        # most 20 spectra.
+        stride = max(1, count // 20)
+        ax.plot(model_wave, model_spectra[::stride].T, c=c, alpha=0.1)
 
     if spectrum_label is not None:
         # Show a label above the spectrum.
@@ -319,7 +474,7 @@ def plot_spectra(light_curve, model, times=[0., 10., 20., 30.], flux_scale=1.,
     spectrum_label_offset : float, optional
         Offset of the time labels for each spectrum, by default 0.2
     """
-    light_curve = preprocess_light_curve(light_curve, model.settings)
+    light_curve = _cached_preprocess_light_curve(light_curve, model.settings)
 
     wave = model.model_wave
     redshift = light_curve.meta['redshift']
@@ -402,7 +557,7 @@ def plot_sne_space(light_curve, model, name, min_wave=10000., max_wave=0., time_
     import urllib
     from scipy.signal import medfilt
 
-    light_curve = preprocess_light_curve(light_curve, model.settings)
+    light_curve = _cached_preprocess_light_curve(light_curve, model.settings)
 
     redshift = light_curve.meta['redshift']
     reference_time = _get_reference_time(light_curve)
@@ -503,7 +658,6 @@ def plot_confusion_matrix(predictions, classifications, figsize=(5, 4), title=No
         Whether to print additional statistics, by default True
     """
     true_types = np.char.decode(predictions['type'])
-    predicted_types = extract_top_classifications(classifications)
 
     if len(classifications.columns) == 3 and classifications.colnames[2] == 'Other':
         # Single class classification. All labels other than the target one are grouped
@@ -511,11 +665,44 @@ def plot_confusion_matrix(predictions, classifications, figsize=(5, 4), title=No
         single_type = classifications.colnames[1]
         true_types[true_types != single_type] = 'Other'
 
+        # With only two classes, a single comparison of the probability columns is
+        # cheaper than a full argmax over the table.
+        predicted_types = np.where(
+            np.asarray(classifications[single_type])
+            >= np.asarray(classifications['Other']),
+            single_type, 'Other'
+        )
+    else:
+        predicted_types = extract_top_classifications(classifications)
+
     type_names = classifications.colnames[1:]
 
     plt.figure(figsize=figsize, constrained_layout=True)
-    cm = confusion_matrix(true_types, predicted_types, labels=type_names,
-                          normalize='true')
+
+    # Build the confusion matrix with a single bincount over integer type indices.
+    # This avoids the generic string handling in sklearn's confusion_matrix which is
+    # much slower for large prediction sets.
+    num_types = len(type_names)
+    type_names_array = np.array(type_names)
+    type_order = np.argsort(type_names_array)
+    sorted_type_names = type_names_array[type_order]
+
+    # Map the true types to indices in type_names, and drop any that aren't there.
+    true_locs = np.searchsorted(sorted_type_names, true_types)
+    true_locs = np.clip(true_locs, 0, num_types - 1)
+    valid = sorted_type_names[true_locs] == true_types
+    true_idx = type_order[true_locs[valid]]
+
+    # The predicted types all come from the classifications columns, so they are
+    # guaranteed to be in type_names.
+    pred_idx = type_order[np.searchsorted(sorted_type_names, predicted_types[valid])]
+
+    cm = np.bincount(true_idx * num_types + pred_idx, minlength=num_types * num_types)
+    cm = cm.reshape(num_types, num_types).astype(np.float64)
+
+    # Normalize each row by the number of true objects of that type.
+    row_counts = cm.sum(axis=1, keepdims=True)
+    cm /= np.where(row_counts > 0, row_counts, 1)
 
     im = plt.imshow(cm, interpolation='nearest',
                     cmap=plt.cm.Blues, vmin=0, vmax=1)
@@ -523,12 +710,22 @@ def plot_confusion_matrix(predictions, classifications, figsize=(5, 4), title=No
     plt.xticks(tick_marks, type_names, rotation=60, ha='right')
     plt.yticks(tick_marks, type_names)
 
-    fmt = '.2f'
+    # Prepare all of the cell labels and colors up front rather than formatting and
+    # comparing each cell individually.
     thresh = cm.max() / 2.
-    for i, j in itertools.product(range(cm.shape[0]), range(cm.shape[1])):
-        plt.text(j, i, format(cm[i, j], fmt),
-                 horizontalalignment="center",
-                 color="white" if cm[i, j] > thresh else "black")
+    cell_texts = np.char.mod('%.2f', cm)
+    cell_colors = np.where(cm > thresh, 'white', 'black')
+
+    # Draw all of the cell labels with a single Table artist rather than one Text
+    # artist per cell. A bbox spanning the full axes lines the table cells up with
+    # the imshow ones.
+    table = plt.table(cellText=cell_texts, cellLoc='center', loc='center',
+                      bbox=[0, 0, 1, 1], edges='open')
+    table.auto_set_font_size(False)
+    table.set_fontsize(plt.rcParams['font.size'])
+    for (i, j), cell in table.get_celld().items():
+        cell.set_fill(False)
+        cell.get_text().set_color(cell_colors[i, j])
 
     plt.ylabel('True Type')
     plt.xlabel('Predicted Type')
@@ -631,34 +828,81 @@ def plot_representation(predictions, plot_labels, mask=None, idx1=1, idx2=2, idx
             (idx1, idx2, ax)
         ]
 
+    # Proxy legend handles for the classes. The classes are all drawn together with
+    # a single scatter plot below, so they don't have individual artists to put in
+    # the legend.
+    legend_handles = [
+        Line2D([], [], ls='', marker=marker, markersize=markersize,
+               c=color_map[type_name], label=type_name)
+        for type_name in plot_labels
+    ]
+
+    if mask is not None:
+        cut_predictions = predictions[~mask]
+        valid_predictions = predictions[mask]
+    else:
+        cut_predictions = None
+        valid_predictions = predictions
+
+    # Select the predictions for each class once rather than re-filtering the full
+    # table for every panel. The types are mapped to integer codes with a single
+    # pass over the strings so that each class selection is a cheap integer
+    # comparison rather than a string one.
+    types = np.asarray(valid_predictions['type'])
+    if types.dtype.kind == 'S':
+        # Bytes column (e.g. from an HDF5 file). Decode it so that the codes are
+        # keyed on the same strings as the labels.
+        types = np.char.decode(types)
+    unique_types, type_codes = np.unique(types, return_inverse=True)
+    type_code_map = {type_name: code for code, type_name in enumerate(unique_types)}
+    class_predictions = {
+        type_name: valid_predictions[type_codes ==
+                                     type_code_map.get(type_name, -1)][:max_count]
+        for type_name in plot_labels
+    }
+
     for xidx, yidx, ax in plot_vals:
-        if mask is not None:
-            cut_predictions = predictions[~mask]
+        if cut_predictions is not None:
             ax.scatter(cut_predictions[f's{xidx}'], cut_predictions[f's{yidx}'],
                        c='k', s=3, alpha=0.1, label='Unknown')
-            valid_predictions = predictions[mask]
-        else:
-            valid_predictions = predictions
 
-        for type_name in plot_labels:
-            type_predictions = valid_predictions[valid_predictions['type'] ==
-                                                 type_name]
-
-            color = color_map[type_name]
-
-            markers, caps, bars = ax.errorbar(
-                type_predictions[f's{xidx}'][:max_count],
-                type_predictions[f's{yidx}'][:max_count],
-                xerr=type_predictions[f's{xidx}_error'][:max_count],
-                yerr=type_predictions[f's{yidx}_error'][:max_count],
-                label=type_name,
-                ls='',
-                marker=marker,
-                markersize=markersize,
-                c=color,
-            )
+        # Gather the values for all of the classes so that everything can be drawn
+        # with a single scatter plot and a single collection of error bars instead
+        # of one errorbar call (and its many artists) per class.
+        x_vals = []
+        y_vals = []
+        x_errs = []
+        y_errs = []
+        colors = []
 
-            [bar.set_alpha(0.3) for bar in bars]
+        for type_name in plot_labels:
+            type_predictions = class_predictions[type_name]
+
+            x_vals.append(np.asarray(type_predictions[f's{xidx}']))
+            y_vals.append(np.asarray(type_predictions[f's{yidx}']))
+            x_errs.append(np.asarray(type_predictions[f's{xidx}_error']))
+            y_errs.append(np.asarray(type_predictions[f's{yidx}_error']))
+            colors.extend([color_map[type_name]] * len(type_predictions))
+
+        x_vals = np.concatenate(x_vals)
+        y_vals = np.concatenate(y_vals)
+        x_errs = np.concatenate(x_errs)
+        y_errs = np.concatenate(y_errs)
+
+        # Build one error bar segment per point and direction.
+        x_segments = np.stack([
+            np.stack([x_vals - x_errs, y_vals], axis=-1),
+            np.stack([x_vals + x_errs, y_vals], axis=-1),
+        ], axis=1)
+        y_segments = np.stack([
+            np.stack([x_vals, y_vals - y_errs], axis=-1),
+            np.stack([x_vals, y_vals + y_errs], axis=-1),
+        ], axis=1)
+        segments = np.concatenate([x_segments, y_segments])
+
+        ax.add_collection(LineCollection(segments, colors=colors + colors,
+                                         linewidths=1, alpha=0.3))
+        ax.scatter(x_vals, y_vals, c=colors, marker=marker, s=markersize**2)
 
     if idx3 is not None:
         ax12.set_xlabel(f'$s_{idx1}$')
@@ -670,11 +914,12 @@ def plot_representation(predictions, plot_labels, mask=None, idx1=1, idx2=2, idx
 
         if show_legend:
             handles, labels = ax12.get_legend_handles_labels()
-            legend_ax.legend(handles=handles, labels=labels, loc='center',
+            legend_ax.legend(handles=handles + legend_handles, loc='center',
                              ncol=legend_ncol)
     else:
         ax.set_xlabel(f'$s_{idx1}$')
         ax.set_ylabel(f'$s_{idx2}$')
 
         if show_legend:
-            ax.legend(ncol=legend_ncol)
+            handles, labels = ax.get_legend_handles_labels()
+            ax.legend(handles=handles + legend_handles, ncol=legend_ncol)